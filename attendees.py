@@ -1,5 +1,10 @@
-from itertools import count
+from bisect import bisect_left
+from itertools import chain, count
 from pathlib import Path
+import re
+import sys
+import unicodedata
+from urllib.parse import urlparse
 import yaml
 
 import click
@@ -21,6 +26,9 @@ ALL_GROUPS_REQUEST = URL + "groups/search.json?api_username={}&api_key={}"
 ADD_USER_REQUEST = URL + "groups/{}/members.json?api_username={}&api_key={}"
 GROUP_MEMBERS_REQUEST = ADD_USER_REQUEST + "&limit={}"
 
+QUERY_FIELDS = ["affiliation", "location", "domain", "bio"]
+COMBINING_CHARACTERS = "[\u0300-\u036f\u1ab0-\u1aff\u1dc0-\u1dff\u20d0-\u20ff\ufe20-\ufe2f]"
+
 
 @click.group()
 def attendees():
@@ -169,13 +177,139 @@ def name():
     """
     usernames = click.get_text_stream('stdin').read().splitlines()
     users = attendee_list(usernames)
-    users.name.where(~users.name.replace("", np.nan).isnull(), users.index).to_csv(
+    _full_names(users).to_csv(
         click.get_text_stream('stdout'),
         index=False,
         header=False
     )
 
 
+@attendees.command()
+@click.option('--users', '-u', type=click.Path(exists=True, file_okay=True, dir_okay=False),
+              help="Path to user details CSV file.")
+@click.option('--affiliation', '-a', multiple=True, help="Affiliation to filter for.")
+@click.option('--location', '-l', multiple=True, help="Location to filter for.")
+@click.option('--domain', '-d', multiple=True, help="Website domain to filter for.")
+@click.option('--bio', '-b', multiple=True, help="Words in the bio to filter for.")
+@click.option('--any', 'match_any', is_flag=True, default=False,
+              help="Match users fulfilling any instead of all filters.")
+@click.option('--names/--no-names', default=False,
+              help="Write full names, one per line, instead of user details as csv.")
+def query(users, affiliation, location, domain, bio, match_any, names):
+    """Filter user details.
+
+    Reads user details as csv from stdin, as written by 'retrieve', and writes the details
+    of all matching users as csv to stdout.
+
+    Filters are case and accent insensitive and match whole words: 'eth zurich' matches
+    the affiliation 'ETH Zürich, Switzerland'. A trailing '*' turns the last word into a
+    prefix: 'energ*' matches 'energy' and 'energiewende'. Domains match subdomains as well.
+    A filter given several times matches any of its values. Different filters must all
+    match, unless '--any' is given.
+
+    \b
+    Example:
+        cat attendees.csv | python attendees.py query -l germany | python booklet.py build booklet.yml
+        cat attendees.csv | python attendees.py query -a "eth z*" --names | python allocate.py random_allocation room1 room2
+    """
+    filters = {
+        "affiliation": affiliation,
+        "location": location,
+        "domain": domain,
+        "bio": bio
+    }
+    filters = {field: values for field, values in filters.items() if values}
+    if not filters:
+        raise click.UsageError("At least one filter must be given.")
+    for field, values in filters.items():
+        for value in values:
+            if not _query_terms(field, value):
+                raise click.BadParameter("'{}' contains no words to filter for.".format(value),
+                                         param_hint="'--{}'".format(field))
+    if not users:
+        users = click.get_text_stream('stdin')
+    users = pd.read_csv(users, index_col=0, dtype=str).fillna("")
+    selected = AttendeeIndex(users).query(filters, match_any=match_any)
+    if names:
+        _full_names(selected).to_csv(
+            click.get_text_stream('stdout'),
+            index=False,
+            header=False
+        )
+    else:
+        selected.to_csv(click.get_text_stream('stdout'))
+
+
+class AttendeeIndex:
+    """Inverted indexes over user details as returned by `attendee_list`.
+
+    Affiliation, location, and bio are indexed by their normalised words, websites by their
+    domain and all its parent domains. The index of a field is built when it is first queried.
+    Matches are sorted arrays of row positions.
+    """
+
+    def __init__(self, users):
+        self.users = users
+        self.__indexes = {}
+
+    def query(self, filters, match_any=False):
+        """Returns details of all users matching the filters.
+
+        Parameters:
+            * filters: a dict mapping fields in QUERY_FIELDS to a list of values; a user matches
+                       a field if it matches any of its values
+            * match_any: match users fulfilling any instead of all fields
+        """
+        unknown_fields = set(filters.keys()) - set(QUERY_FIELDS)
+        if unknown_fields:
+            raise ValueError("Unknown fields: {}.".format(", ".join(sorted(unknown_fields))))
+        matches = [self.__match(field, values) for field, values in filters.items()]
+        if not matches:
+            positions = np.array([], dtype=np.int64)
+        elif match_any:
+            positions = _union(matches)
+        else:
+            positions = _intersection(matches)
+        return self.users.iloc[positions]
+
+    def __match(self, field, values):
+        return _union([self.__match_value(field, value) for value in values])
+
+    def __match_value(self, field, value):
+        prefix = value.strip().endswith("*")
+        terms = _query_terms(field, value)
+        if not terms:
+            return np.array([], dtype=np.int64)
+        positions = [self.__lookup(field, term) for term in terms[:-1]]
+        if prefix:
+            positions.append(self.__lookup_prefix(field, terms[-1]))
+        else:
+            positions.append(self.__lookup(field, terms[-1]))
+        return _intersection(positions)
+
+    def __lookup(self, field, term):
+        terms, starts, positions = self.__index(field)
+        i = bisect_left(terms, term)
+        if i < len(terms) and terms[i] == term:
+            return positions[starts[i]:starts[i + 1]]
+        return positions[:0]
+
+    def __lookup_prefix(self, field, prefix):
+        terms, starts, positions = self.__index(field)
+        first = bisect_left(terms, prefix)
+        last = bisect_left(terms, prefix + chr(sys.maxunicode)) # all terms starting with prefix
+        return np.unique(positions[starts[first]:starts[last]])
+
+    def __index(self, field):
+        if field not in self.__indexes:
+            if field == "domain":
+                terms = self.users.reindex(columns=["website"])["website"].fillna("").map(_domains)
+            else:
+                terms = _tokens_of_column(self.users.reindex(columns=[field])[field])
+            self.__indexes[field] = _posting_lists(terms)
+        return self.__indexes[field]
+
+
 def check_usernames(usernames):
     """Returns all usernames that do not exist."""
     items = []
@@ -224,6 +358,90 @@ def group_members(group_name, api_username, api_key):
     return [member["username"] for member in members]
 
 
+def _full_names(users):
+    return users.name.where(~users.name.replace("", np.nan).isnull(), users.index)
+
+
+def _normalise(text):
+    return re.sub(COMBINING_CHARACTERS, "", unicodedata.normalize("NFKD", text)).lower()
+
+
+def _tokens(text):
+    return re.findall(r"\w+", _normalise(text))
+
+
+def _tokens_of_column(texts):
+    """Vectorised version of `_tokens` for a column of texts."""
+    return (texts.fillna("")
+                 .astype(str)
+                 .str.normalize("NFKD")
+                 .map(lambda text: re.sub(COMBINING_CHARACTERS, "", text))
+                 .str.lower()
+                 .str.findall(r"\w+"))
+
+
+def _query_terms(field, value):
+    """Returns the terms to look up for a filter value of a field."""
+    if field == "domain":
+        return _domains(value.strip().rstrip("*"))[:1]
+    return _tokens(value)
+
+
+def _domains(website):
+    """Returns the domain of a website and all its parent domains, most specific first."""
+    website = _normalise(website).strip()
+    if not website:
+        return []
+    if "//" not in website:
+        website = "//" + website
+    try:
+        host = urlparse(website).hostname or ""
+    except ValueError: # websites are free text and may not be valid urls
+        return []
+    if host.startswith("www."):
+        host = host[len("www."):]
+    labels = host.split(".")
+    return [".".join(labels[i:]) for i in range(max(len(labels) - 1, 1))]
+
+
+def _posting_lists(terms):
+    """Inverts a series of term lists into sorted terms and the positions of rows containing them.
+
+    Positions of rows containing the i-th term are `positions[starts[i]:starts[i + 1]]`.
+    """
+    lengths = np.asarray(terms.map(len).values, dtype=np.int64) # object dtype if there are no rows
+    row_positions = np.repeat(np.arange(len(terms), dtype=np.int64), lengths)
+    all_terms = np.array(list(chain.from_iterable(terms)), dtype=object)
+    codes, unique_terms = pd.factorize(all_terms, sort=True)
+    order = np.argsort(codes, kind="stable") # row positions are ascending already
+    codes, row_positions = codes[order], row_positions[order]
+    unique = np.ones(len(codes), dtype=bool)
+    unique[1:] = (codes[1:] != codes[:-1]) | (row_positions[1:] != row_positions[:-1])
+    codes, row_positions = codes[unique], row_positions[unique]
+    starts = np.searchsorted(codes, np.arange(len(unique_terms) + 1))
+    row_positions.flags.writeable = False # lookups return views
+    return list(unique_terms), starts, row_positions
+
+
+def _intersection(positions):
+    positions = sorted(positions, key=len)
+    result = positions[0]
+    for other in positions[1:]:
+        if len(result) == 0 or len(other) == 0:
+            return other[:0]
+        candidates = np.minimum(np.searchsorted(other, result), len(other) - 1)
+        result = result[other[candidates] == result]
+    return result
+
+
+def _union(positions):
+    if not positions:
+        return np.array([], dtype=np.int64)
+    if len(positions) == 1:
+        return positions[0]
+    return np.unique(np.concatenate(positions))
+
+
 def _get_user(username):
     r = requests.get(USER_REQUEST.format(username))
     r.raise_for_status()
@@ -0,0 +1,130 @@
+import io
+
+from click.testing import CliRunner
+import pandas as pd
+import pytest
+
+import attendees
+
+
+@pytest.fixture
+def users():
+    return pd.DataFrame(
+        index=["timtroendle", "tom_brown", "jane_doe", "john_doe"],
+        data={
+            "name": ["Tim Tröndle", "Tom Brown", "", "John Doe"],
+            "avatar_url": ["", "", "", ""],
+            "location": ["Zürich", "", "Berlin, Germany", ""],
+            "website": [
+                "http://www.rep.ethz.ch/people/person-detail.html?persid=240778",
+                "https://www.nworbmot.org/",
+                "ethz.ch",
+                "http://[bad"
+            ],
+            "bio": ["PhD researcher in the Renewable Energy Policy group at ETH Zürich", "", "Energiewende", ""],
+            "affiliation": ["ETH Zürich", "", "Technische Universität Berlin", ""]
+        }
+    )
+
+
+@pytest.fixture
+def attendee_index(users):
+    return attendees.AttendeeIndex(users)
+
+
+@pytest.fixture
+def users_csv(users):
+    return users.to_csv()
+
+
+@pytest.mark.parametrize("filters,expected", [
+    ({"affiliation": ["eth zurich"]}, ["timtroendle"]),
+    ({"affiliation": ["ETH Zürich"]}, ["timtroendle"]),
+    ({"affiliation": ["eth berlin"]}, []),
+    ({"affiliation": ["universitat"]}, ["jane_doe"]),
+    ({"location": ["germany"]}, ["jane_doe"]),
+    ({"location": ["germany", "zurich"]}, ["timtroendle", "jane_doe"]),
+    ({"domain": ["ethz.ch"]}, ["timtroendle", "jane_doe"]),
+    ({"domain": ["https://www.nworbmot.org"]}, ["tom_brown"]),
+    ({"domain": ["rep.ethz.ch"]}, ["timtroendle"]),
+    ({"domain": ["nworb*"]}, ["tom_brown"]),
+    ({"domain": ["http://[bad"]}, []),
+    ({"bio": ["energy"]}, ["timtroendle"]),
+    ({"bio": ["energ*"]}, ["timtroendle", "jane_doe"]),
+    ({"bio": ["renewable policy"]}, ["timtroendle"]),
+    ({"bio": ["energ*"], "domain": ["rep.ethz.ch"]}, ["timtroendle"]),
+    ({"bio": ["*"]}, [])
+])
+def test_query_attendee_index(attendee_index, filters, expected):
+    assert list(attendee_index.query(filters).index) == expected
+
+
+def test_query_attendee_index_any(attendee_index):
+    selected = attendee_index.query({"location": ["germany"], "domain": ["nworbmot.org"]}, match_any=True)
+    assert list(selected.index) == ["tom_brown", "jane_doe"]
+
+
+def test_query_attendee_index_fails_with_unknown_field(attendee_index):
+    with pytest.raises(ValueError):
+        attendee_index.query({"email": ["example.org"]})
+
+
+def test_query_fails_without_filter(users_csv):
+    result = CliRunner().invoke(attendees.attendees, ["query"], input=users_csv)
+    assert result.exit_code == 2
+    assert "At least one filter must be given." in result.output
+
+
+def test_query_writes_readable_csv(users, users_csv):
+    result = CliRunner().invoke(attendees.attendees, ["query", "-l", "germany"], input=users_csv)
+    assert result.exit_code == 0
+    selected = pd.read_csv(io.StringIO(result.output), index_col=0, dtype=str).fillna("")
+    pd.testing.assert_frame_equal(selected, users.loc[["jane_doe"]])
+
+
+def test_query_writes_names(users_csv):
+    result = CliRunner().invoke(attendees.attendees, ["query", "-d", "ethz.ch", "--names"], input=users_csv)
+    assert result.exit_code == 0
+    assert result.output.splitlines() == ["Tim Tröndle", "jane_doe"]
+
+
+def test_query_reads_users_file(users_csv, tmpdir):
+    path_to_users = tmpdir.join("users.csv")
+    path_to_users.write_text(users_csv, encoding="utf-8")
+    result = CliRunner().invoke(attendees.attendees, ["query", "-u", str(path_to_users), "-a", "eth*", "--names"])
+    assert result.exit_code == 0
+    assert result.output.splitlines() == ["Tim Tröndle"]
+
+
+def test_query_matches_any_filter(users_csv):
+    result = CliRunner().invoke(
+        attendees.attendees,
+        ["query", "-l", "germany", "-d", "nworbmot.org", "--any", "--names"],
+        input=users_csv
+    )
+    assert result.exit_code == 0
+    assert result.output.splitlines() == ["Tom Brown", "jane_doe"]
+
+
+def test_query_attendee_index_without_values(attendee_index):
+    assert attendee_index.query({"location": []}).empty
+
+
+def test_query_accepts_users_without_rows(users):
+    header_only = users.iloc[:0].to_csv()
+    for field in ["-l", "-d", "-b"]:
+        result = CliRunner().invoke(attendees.attendees, ["query", field, "x"], input=header_only)
+        assert result.exit_code == 0
+        assert pd.read_csv(io.StringIO(result.output), index_col=0).empty
+
+
+@pytest.mark.parametrize("option,value", [
+    ("-l", ""),
+    ("-b", "*"),
+    ("-a", " - "),
+    ("-d", "*")
+])
+def test_query_fails_with_value_without_words(users_csv, option, value):
+    result = CliRunner().invoke(attendees.attendees, ["query", "-l", "germany", option, value], input=users_csv)
+    assert result.exit_code == 2
+    assert "contains no words to filter for" in result.output